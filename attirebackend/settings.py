@@ -147,6 +147,12 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded images above 1MB spool to temp files instead of being held in
+# RAM (Django's default is 2.5MB). This does not limit upload size; the
+# per-image cap below does, and AnalyzeAttireView enforces it.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+MAX_ATTENDANCE_IMAGE_SIZE = 10 * 1024 * 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -188,3 +194,13 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+
+
+# =======================
+# ATTIRE ANALYSIS
+# =======================
+
+# Run the OpenAI Vision analysis after responding to a self-verify punch
+# (HTTP 202, poll /api/attendance/<id>/?token=<poll_token>). Set to "false"
+# to analyze inline.
+ATTIRE_ANALYSIS_IN_BACKGROUND = os.getenv("ATTIRE_ANALYSIS_IN_BACKGROUND", "true").lower() == "true"
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-15 01:19
+
+from django.db import migrations, models
+
+
+def remove_duplicate_punches(apps, schema_editor):
+    """
+    Keep the earliest punch per employee per day so uniq_att_emp_date
+    can be added over existing data.
+    """
+    Attendance = apps.get_model('visualcheck', 'Attendance')
+    seen = set()
+    duplicate_ids = []
+    rows = (
+        Attendance.objects
+        .order_by('employee_id', 'date', 'punch_time', 'id')
+        .values_list('id', 'employee_id', 'date')
+    )
+    for pk, employee_id, date in rows.iterator():
+        if (employee_id, date) in seen:
+            duplicate_ids.append(pk)
+        else:
+            seen.add((employee_id, date))
+
+    for start in range(0, len(duplicate_ids), 500):
+        Attendance.objects.filter(id__in=duplicate_ids[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualcheck', '0002_remove_attendance_full_body_image_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['status', '-punch_time'], name='att_status_ptime_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_punches, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(fields=('employee', 'date'), name='uniq_att_emp_date'),
+        ),
+    ]
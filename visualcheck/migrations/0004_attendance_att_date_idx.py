@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-15 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visualcheck', '0003_attendance_att_status_ptime_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['date'], name='att_date_idx'),
+        ),
+    ]
@@ -57,3 +57,15 @@ class Attendance(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
     verified_by = models.CharField(max_length=50, null=True, blank=True)
     verified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Admin pending/verified lists: filter by status, newest first
+            models.Index(fields=["status", "-punch_time"], name="att_status_ptime_idx"),
+            # Daily attendance report: all punches on a given date
+            models.Index(fields=["date"], name="att_date_idx"),
+        ]
+        constraints = [
+            # One punch per employee per day (its unique index also serves lookups)
+            models.UniqueConstraint(fields=["employee", "date"], name="uniq_att_emp_date"),
+        ]
@@ -0,0 +1,108 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from django.db import connection
+from django.utils.timezone import now
+
+from .models import Attendance
+from .services.visual_feedback_service import analyze_attire_from_bytes
+
+# In-process worker pool for vision analysis; keeps the punch request short
+analysis_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="attire-analysis")
+
+# Every queued job holds both raw uploads in memory, so cap the backlog
+MAX_PENDING_ANALYSES = 20
+_pending_slots = threading.BoundedSemaphore(MAX_PENDING_ANALYSES)
+
+MAX_RETRIES = 3
+RETRY_DELAY_SECONDS = 5
+
+
+def analyze_and_update_attendance(
+    attendance_id: int,
+    upper_body_bytes: bytes,
+    full_body_bytes: bytes,
+    candidate_name: Optional[str] = None,
+    candidate_id: Optional[str] = None,
+    content_hash: Optional[str] = None,
+) -> None:
+    """
+    Run the vision analysis for a punch and store it on the Attendance row.
+    API/transport failures are retried with exponential backoff (5s, 10s, 20s);
+    bad images or unparseable replies fail the same way every time and are not.
+    """
+    try:
+        for attempt in range(MAX_RETRIES + 1):
+            ai_response = analyze_attire_from_bytes(
+                upper_body_bytes=upper_body_bytes,
+                full_body_bytes=full_body_bytes,
+                candidate_name=candidate_name,
+                candidate_id=candidate_id,
+                content_hash=content_hash,
+            )
+            # Internal retry hint; never stored on the row or shown to clients
+            retryable = ai_response.pop("retryable", False)
+            if not retryable or attempt == MAX_RETRIES:
+                break
+
+            print(f"Analysis for attendance {attendance_id} failed, retrying: {ai_response}")
+            time.sleep(RETRY_DELAY_SECONDS * 2 ** attempt)
+
+        Attendance.objects.filter(id=attendance_id).update(
+            ai_response=ai_response,
+            verified_by="SELF",
+            verified_at=now()
+        )
+
+    except Exception as e:
+        print(f"Background analysis error for attendance {attendance_id}: {e}")
+
+    finally:
+        # Worker threads outlive the request cycle, so close their DB connection
+        connection.close()
+
+
+def _run_queued_analysis(*args) -> None:
+    try:
+        analyze_and_update_attendance(*args)
+    finally:
+        _pending_slots.release()
+
+
+def has_analysis_capacity() -> bool:
+    """
+    Cheap pre-check so a punch can be turned away before any upload work.
+    """
+    if not _pending_slots.acquire(blocking=False):
+        return False
+    _pending_slots.release()
+    return True
+
+
+def enqueue_attendance_analysis(
+    attendance_id: int,
+    upper_body_bytes: bytes,
+    full_body_bytes: bytes,
+    candidate_name: Optional[str] = None,
+    candidate_id: Optional[str] = None,
+    content_hash: Optional[str] = None,
+) -> bool:
+    """
+    Schedule analyze_and_update_attendance on the background pool.
+    Returns False, without queueing, when MAX_PENDING_ANALYSES are in flight.
+    """
+    if not _pending_slots.acquire(blocking=False):
+        return False
+
+    analysis_executor.submit(
+        _run_queued_analysis,
+        attendance_id,
+        upper_body_bytes,
+        full_body_bytes,
+        candidate_name,
+        candidate_id,
+        content_hash,
+    )
+    return True
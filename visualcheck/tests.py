@@ -1,3 +1,414 @@
-from django.test import TestCase
+import io
+import json
+import threading
+from unittest.mock import MagicMock, patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase
+from django.utils.timezone import now
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .models import Employee, Attendance
+from .services import visual_feedback_service
+from .services.visual_feedback_service import _validate_and_resize_bytes, analyze_attire_from_bytes
+from .tasks import MAX_RETRIES, analyze_and_update_attendance
+from .utils.s3_upload import upload_bytes_to_s3
+from .views import DailyAttendanceView
+
+
+def _punch_data(**overrides):
+    data = {
+        "upper_body": SimpleUploadedFile("upper.jpg", b"upper", content_type="image/jpeg"),
+        "full_body": SimpleUploadedFile("full.jpg", b"full", content_type="image/jpeg"),
+        "employee_name": "Asha",
+        "employee_id": "E001",
+        "location": "Store 12",
+        "verify_type": "admin",
+    }
+    data.update(overrides)
+    return data
+
+
+def _solid_png(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _vision_reply(content):
+    response = MagicMock()
+    response.choices[0].message.content = content
+    return response
+
+
+@patch("visualcheck.views.upload_bytes_to_s3", return_value="https://bucket.s3.amazonaws.com/x.jpg")
+class AnalyzeAttireViewTests(TestCase):
+
+    def test_punch_creates_pending_attendance(self, mock_upload):
+        response = self.client.post("/api/analyze-attire/", _punch_data())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "PENDING_ADMIN")
+        attendance = Attendance.objects.get()
+        self.assertEqual(attendance.upper_body_image_url, "https://bucket.s3.amazonaws.com/x.jpg")
+        self.assertEqual(attendance.full_body_image_url, "https://bucket.s3.amazonaws.com/x.jpg")
+
+    def test_second_punch_same_day_is_rejected(self, mock_upload):
+        self.client.post("/api/analyze-attire/", _punch_data())
+
+        response = self.client.post("/api/analyze-attire/", _punch_data())
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["message"], "Already punched today")
+        self.assertEqual(Attendance.objects.count(), 1)
+
+    def test_oversized_image_is_rejected_before_upload(self, mock_upload):
+        with self.settings(MAX_ATTENDANCE_IMAGE_SIZE=4):
+            response = self.client.post("/api/analyze-attire/", _punch_data())
+
+        self.assertEqual(response.status_code, 413)
+        mock_upload.assert_not_called()
+        self.assertFalse(Attendance.objects.exists())
+
+    @patch("visualcheck.views.analyze_attire_from_bytes")
+    def test_duplicate_punch_never_starts_analysis(self, mock_analyze, mock_upload):
+        self.client.post("/api/analyze-attire/", _punch_data())
+
+        with self.settings(ATTIRE_ANALYSIS_IN_BACKGROUND=False):
+            response = self.client.post("/api/analyze-attire/", _punch_data(verify_type="self"))
+
+        self.assertEqual(response.status_code, 400)
+        mock_analyze.assert_not_called()
+
+    def test_failed_upload_drops_row_without_waiting_for_analysis(self, mock_upload):
+        mock_upload.side_effect = RuntimeError("S3 down")
+        release, finished = threading.Event(), threading.Event()
+
+        def slow_analysis(**kwargs):
+            release.wait(5)
+            finished.set()
+            return {"status": "success"}
+
+        client = Client(raise_request_exception=False)
+        try:
+            with patch("visualcheck.views.analyze_attire_from_bytes", side_effect=slow_analysis), \
+                    self.settings(ATTIRE_ANALYSIS_IN_BACKGROUND=False):
+                response = client.post("/api/analyze-attire/", _punch_data(verify_type="self"))
+
+            # Returned while the analysis was still blocked
+            self.assertFalse(finished.is_set())
+        finally:
+            release.set()
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Attendance.objects.exists())
+
+
+@patch("visualcheck.views.upload_bytes_to_s3", return_value="https://bucket.s3.amazonaws.com/x.jpg")
+@patch("visualcheck.services.visual_feedback_service.client")
+class RepeatUploadTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.photo = _solid_png("red")
+
+    def _punch(self, employee_id):
+        data = _punch_data(
+            upper_body=SimpleUploadedFile("upper.png", self.photo, content_type="image/png"),
+            full_body=SimpleUploadedFile("full.png", self.photo, content_type="image/png"),
+            employee_id=employee_id,
+            verify_type="self",
+        )
+        with self.settings(ATTIRE_ANALYSIS_IN_BACKGROUND=False):
+            response = self.client.post("/api/analyze-attire/", data)
+        # Clear the day's punch so the same employee can post again
+        Attendance.objects.all().delete()
+        return response
+
+    def test_same_upload_skips_decoding_and_api(self, mock_client, mock_upload):
+        mock_client.chat.completions.create.return_value = _vision_reply('{"overall_summary": "ok"}')
+
+        with patch(
+            "visualcheck.services.visual_feedback_service._prepare_frames",
+            wraps=visual_feedback_service._prepare_frames,
+        ) as mock_prepare:
+            first = self._punch("E001")
+            second = self._punch("E001")
+
+            self.assertEqual(mock_prepare.call_count, 1)
+            self.assertEqual(mock_client.chat.completions.create.call_count, 1)
+            self.assertEqual(second.json()["ai_analysis"], first.json()["ai_analysis"])
+
+            self._punch("E002")
+
+            self.assertEqual(mock_prepare.call_count, 2)
+            self.assertEqual(mock_client.chat.completions.create.call_count, 2)
+
+
+@patch("visualcheck.views.upload_bytes_to_s3", return_value="https://bucket.s3.amazonaws.com/x.jpg")
+@patch("visualcheck.views.enqueue_attendance_analysis", return_value=True)
+class BackgroundAnalysisTests(TestCase):
+
+    def test_self_punch_returns_202_with_poll_token(self, mock_enqueue, mock_upload):
+        response = self.client.post("/api/analyze-attire/", _punch_data(verify_type="self"))
+
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        self.assertEqual(body["status"], "PROCESSING")
+        mock_enqueue.assert_called_once()
+
+        detail = self.client.get(
+            f"/api/attendance/{body['attendance_id']}/", {"token": body["poll_token"]}
+        )
+        self.assertEqual(detail.status_code, 200)
+        self.assertEqual(detail.json()["status"], "PROCESSING")
+
+    def test_detail_requires_matching_token(self, mock_enqueue, mock_upload):
+        first = self.client.post("/api/analyze-attire/", _punch_data(verify_type="self")).json()
+        second = self.client.post(
+            "/api/analyze-attire/", _punch_data(verify_type="self", employee_id="E002")
+        ).json()
+
+        no_token = self.client.get(f"/api/attendance/{first['attendance_id']}/")
+        wrong_token = self.client.get(
+            f"/api/attendance/{first['attendance_id']}/", {"token": second["poll_token"]}
+        )
+
+        self.assertEqual(no_token.status_code, 403)
+        self.assertEqual(wrong_token.status_code, 403)
+
+
+@patch("visualcheck.tasks.time.sleep")
+class AnalyzeAndUpdateAttendanceTests(TestCase):
+
+    def setUp(self):
+        employee = Employee.objects.create(employee_id="E001", name="Asha")
+        self.attendance = Attendance.objects.create(
+            employee=employee,
+            upper_body_image_url="https://bucket.s3.amazonaws.com/u.jpg",
+            full_body_image_url="https://bucket.s3.amazonaws.com/f.jpg",
+            location_text="Store 12",
+            status="SELF_VERIFIED"
+        )
+
+    def _run(self, ai_response):
+        # A fresh dict per attempt, as the real service returns
+        with patch("visualcheck.tasks.analyze_attire_from_bytes", side_effect=lambda **kw: dict(ai_response)) as mock_analyze, \
+                patch("visualcheck.tasks.connection.close"):
+            analyze_and_update_attendance(self.attendance.id, b"u", b"f")
+        return mock_analyze
+
+    def test_bad_images_are_not_retried(self, mock_sleep):
+        mock_analyze = self._run({"status": "error", "message": "No valid images to analyze"})
+
+        self.assertEqual(mock_analyze.call_count, 1)
+        mock_sleep.assert_not_called()
+        self.attendance.refresh_from_db()
+        self.assertEqual(self.attendance.ai_response["status"], "error")
+
+    def test_api_errors_are_retried(self, mock_sleep):
+        mock_analyze = self._run({"status": "error", "message": "Analysis failed", "retryable": True})
+
+        self.assertEqual(mock_analyze.call_count, MAX_RETRIES + 1)
+        self.assertEqual(mock_sleep.call_count, MAX_RETRIES)
+        self.attendance.refresh_from_db()
+        self.assertEqual(self.attendance.ai_response["status"], "error")
+        self.assertNotIn("retryable", self.attendance.ai_response)
+
+
+class ValidateAndResizeBytesTests(SimpleTestCase):
+
+    def _encode(self, img, fmt):
+        buffer = io.BytesIO()
+        img.save(buffer, format=fmt)
+        return buffer.getvalue()
+
+    def test_transparency_is_kept(self):
+        src = Image.new("RGBA", (800, 600), (255, 0, 0, 0))
+
+        out = Image.open(io.BytesIO(_validate_and_resize_bytes(self._encode(src, "PNG"))))
+
+        self.assertEqual(out.format, "WEBP")
+        self.assertEqual(out.mode, "RGBA")
+        self.assertEqual(out.getpixel((0, 0))[3], 0)
+        self.assertLessEqual(max(out.size), 512)
+
+    def test_palette_image_becomes_rgb(self):
+        src = Image.new("RGB", (100, 100), (0, 128, 255)).convert("P")
+
+        out = Image.open(io.BytesIO(_validate_and_resize_bytes(self._encode(src, "PNG"))))
+
+        self.assertEqual(out.mode, "RGB")
+
+
+@patch("visualcheck.services.visual_feedback_service.client")
+class AnalysisCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.red, self.blue = _solid_png("red"), _solid_png("blue")
+
+    def _analyze(self, frame, candidate_id="E001"):
+        return analyze_attire_from_bytes(frame, frame, "Asha", candidate_id)
+
+    def test_repeat_photos_skip_the_api(self, mock_client):
+        mock_client.chat.completions.create.return_value = _vision_reply('{"overall_summary": "ok"}')
+
+        first = self._analyze(self.red)
+        second = self._analyze(self.red)
+
+        self.assertEqual(mock_client.chat.completions.create.call_count, 1)
+        self.assertEqual(second, first)
+
+    def test_different_photos_are_analyzed_again(self, mock_client):
+        mock_client.chat.completions.create.return_value = _vision_reply('{"overall_summary": "ok"}')
+
+        self._analyze(self.red)
+        self._analyze(self.blue)
+
+        self.assertEqual(mock_client.chat.completions.create.call_count, 2)
+
+    def test_cache_is_per_candidate(self, mock_client):
+        mock_client.chat.completions.create.return_value = _vision_reply('{"overall_summary": "ok"}')
+
+        self._analyze(self.red, "E001")
+        self._analyze(self.red, "E002")
+
+        self.assertEqual(mock_client.chat.completions.create.call_count, 2)
+
+    def test_parse_errors_are_not_cached(self, mock_client):
+        mock_client.chat.completions.create.return_value = _vision_reply("not json")
+
+        self.assertEqual(self._analyze(self.red)["status"], "parse_error")
+        self._analyze(self.red)
+
+        self.assertEqual(mock_client.chat.completions.create.call_count, 2)
+
+    def test_api_errors_are_not_cached(self, mock_client):
+        mock_client.chat.completions.create.side_effect = RuntimeError("timeout")
+
+        self.assertEqual(self._analyze(self.red)["status"], "error")
+        self._analyze(self.red)
+
+        self.assertEqual(mock_client.chat.completions.create.call_count, 2)
+
+
+@patch("visualcheck.utils.s3_upload.s3_client")
+class UploadBytesToS3Tests(SimpleTestCase):
+
+    def _put(self, mock_s3, content_type):
+        url = upload_bytes_to_s3(b"data", "attendance/upper", content_type)
+        return url, mock_s3.put_object.call_args.kwargs
+
+    def test_image_types_keep_their_extension(self, mock_s3):
+        url, kwargs = self._put(mock_s3, "image/png")
+
+        self.assertTrue(url.endswith(".png"))
+        self.assertEqual(kwargs["ContentType"], "image/png")
+
+    def test_other_types_are_stored_as_jpeg(self, mock_s3):
+        for content_type in ("text/html", "application/octet-stream", None):
+            url, kwargs = self._put(mock_s3, content_type)
+
+            self.assertTrue(url.endswith(".jpg"))
+            self.assertTrue(kwargs["Key"].endswith(".jpg"))
+            self.assertEqual(kwargs["ContentType"], "image/jpeg")
+
+
+class DailyAttendanceViewTests(TestCase):
+
+    def _get(self, params):
+        request = RequestFactory().get("/attendance/daily/", params)
+        return DailyAttendanceView.as_view()(request)
+
+    def test_missing_date_is_rejected(self):
+        self.assertEqual(self._get({}).status_code, 400)
+
+    def test_malformed_date_is_rejected(self):
+        self.assertEqual(self._get({"date": "15-10-2026"}).status_code, 400)
+
+    def test_valid_date_lists_punches(self):
+        employee = Employee.objects.create(employee_id="E001", name="Asha")
+        Attendance.objects.create(
+            employee=employee,
+            upper_body_image_url="https://bucket.s3.amazonaws.com/u.jpg",
+            full_body_image_url="https://bucket.s3.amazonaws.com/f.jpg",
+            location_text="Store 12",
+            status="PENDING_ADMIN"
+        )
+
+        response = self._get({"date": now().date().isoformat()})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 1)
+
+
+def _make_attendance(employee_id, status):
+    employee = Employee.objects.create(employee_id=employee_id, name=f"Employee {employee_id}")
+    return Attendance.objects.create(
+        employee=employee,
+        upper_body_image_url="https://bucket.s3.amazonaws.com/u.jpg",
+        full_body_image_url="https://bucket.s3.amazonaws.com/f.jpg",
+        location_text="Store 12",
+        status=status
+    )
+
+
+class AdminAttendanceListTests(TestCase):
+
+    def test_pending_list_is_one_query(self):
+        for i in range(5):
+            _make_attendance(f"P{i}", "PENDING_ADMIN")
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/attendance/admin/pending/")
+
+        data = response.json()
+        self.assertEqual(len(data), 5)
+        self.assertEqual({row["employee_id"] for row in data}, {f"P{i}" for i in range(5)})
+
+    def test_verified_list_is_one_query(self):
+        for i in range(3):
+            _make_attendance(f"S{i}", "SELF_VERIFIED")
+        for i in range(2):
+            _make_attendance(f"A{i}", "ADMIN_VERIFIED")
+        _make_attendance("X0", "PENDING_ADMIN")
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/attendance/admin/verified/")
+
+        data = response.json()
+        self.assertEqual(len(data), 5)
+        self.assertTrue(all(row["employee_name"].startswith("Employee ") for row in data))
+
+
+class AdminVerifyAttendanceViewTests(TestCase):
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(
+            User.objects.create_user(username="admin", password="x", is_staff=True)
+        )
+        self.attendance = _make_attendance("E001", "PENDING_ADMIN")
+        self.url = f"/api/attendance/admin/verify/{self.attendance.id}/"
+
+    def test_approve_verifies_once(self):
+        first = self.api.post(self.url, {"action": "approve"}, format="json")
+        second = self.api.post(self.url, {"action": "reject"}, format="json")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()["status"], "ADMIN_VERIFIED")
+        self.assertEqual(second.status_code, 400)
+        self.attendance.refresh_from_db()
+        self.assertEqual(self.attendance.status, "ADMIN_VERIFIED")
+        self.assertEqual(self.attendance.verified_by, "admin")
+
+    def test_unknown_attendance_is_rejected(self):
+        response = self.api.post(
+            "/api/attendance/admin/verify/999/", {"action": "approve"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 400)
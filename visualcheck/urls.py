@@ -1,8 +1,10 @@
 from django.urls import path
 from .views import AnalyzeAttireView,AdminPendingAttendanceView,AdminVerifiedAttendanceView,AdminVerifyAttendanceView
+from .views import AttendanceDetailView
 from .views import AdminLoginJWTView
 urlpatterns = [
     path("analyze-attire/", AnalyzeAttireView.as_view(), name="analyze_attire"),
+    path("attendance/<int:attendance_id>/", AttendanceDetailView.as_view(), name="attendance_detail"),
     path("attendance/admin/pending/", AdminPendingAttendanceView.as_view()),
     path("attendance/admin/verified/", AdminVerifiedAttendanceView.as_view()),
     path(
@@ -1,32 +1,60 @@
 import uuid
-import io
+from typing import Optional
 import boto3
+from botocore.config import Config
 from django.conf import settings
 
-s3_client = boto3.client(
-    "s3",
+# Keep-alive pool sized for parallel uploads; adaptive retries handle throttling
+s3_config = Config(
+    max_pool_connections=50,
+    retries={"max_attempts": 3, "mode": "adaptive"},
+    tcp_keepalive=True,
+    s3={"addressing_style": "virtual"},
+)
+
+# Credentials are resolved once, when the module-level session is built
+s3_session = boto3.session.Session(
     aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
     aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
     region_name=settings.AWS_S3_REGION_NAME,
 )
 
-def upload_bytes_to_s3(file_bytes: bytes, folder: str, content_type: str) -> str:
+s3_client = s3_session.client("s3", config=s3_config)
+
+# content_type comes from the client, so only these are stored as-is;
+# anything else is saved as JPEG rather than e.g. served back as .html
+IMAGE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+}
+
+def upload_bytes_to_s3(
+    file_bytes: bytes,
+    folder: str,
+    content_type: str,
+    extension: Optional[str] = None,
+) -> str:
     """
     Upload raw bytes to S3 and return public URL
     (ACL NOT USED – bucket owner enforced)
+
+    extension defaults to one matching content_type (e.g. ".webp");
+    non-image content types fall back to image/jpeg and ".jpg".
     """
-    filename = f"{uuid.uuid4()}.jpg"
+    if content_type not in IMAGE_EXTENSIONS:
+        content_type = "image/jpeg"
+    if extension is None:
+        extension = IMAGE_EXTENSIONS[content_type]
+    filename = f"{uuid.uuid4().hex}{extension}"
     s3_key = f"{folder}/{filename}"
 
-    file_obj = io.BytesIO(file_bytes)
-
-    s3_client.upload_fileobj(
-        file_obj,
-        settings.AWS_STORAGE_BUCKET_NAME,
-        s3_key,
-        ExtraArgs={
-            "ContentType": content_type
-        }
+    # Single-shot PUT: images are small, no need for the multipart transfer manager
+    s3_client.put_object(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=s3_key,
+        Body=file_bytes,
+        ContentType=content_type
     )
 
     return f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com/{s3_key}"
@@ -1,21 +1,24 @@
-import base64
-from typing import Any
+import datetime
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Tuple
 from .utils.s3_upload import upload_bytes_to_s3
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
+from django.core import signing
+from django.db import IntegrityError, transaction
 from django.http import JsonResponse, HttpRequest
 from django.views import View
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.timezone import now
 from .models import Employee, Attendance
-from .services.visual_feedback_service import analyze_attire_from_two_images
-from django.utils.timezone import now
-from .models import Employee, Attendance
+from .services.visual_feedback_service import analyze_attire_from_bytes
+from .tasks import enqueue_attendance_analysis, has_analysis_capacity
 import json
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from rest_framework.permissions import IsAuthenticated
@@ -23,8 +26,22 @@ from rest_framework_simplejwt.authentication import JWTAuthentication
 
 
 
-def bytes_to_base64(file_bytes: bytes) -> str:
-    return base64.b64encode(file_bytes).decode("utf-8")
+# Poll tokens handed out with 202 responses (see AttendanceDetailView)
+ATTENDANCE_POLL_SALT = "visualcheck.attendance-poll"
+ATTENDANCE_POLL_MAX_AGE = 60 * 60 * 24
+
+
+def read_upload(uploaded_file) -> Tuple[bytes, str]:
+    """
+    Read an upload chunk by chunk (no intermediate buffer copy) and
+    return its bytes together with a blake2b content digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    chunks = []
+    for chunk in uploaded_file.chunks():
+        chunks.append(chunk)
+        digest.update(chunk)
+    return b"".join(chunks), digest.hexdigest()
 
 
 @method_decorator(csrf_exempt, name="dispatch")
@@ -49,68 +66,113 @@ class AnalyzeAttireView(View):
         if not location_text:
             return JsonResponse({"error": "Location required"}, status=400)
 
-        # 2️⃣ Read file bytes ONCE (CRITICAL)
-        upper_bytes = upper_file.read()
-        full_bytes = full_file.read()
+        if max(upper_file.size, full_file.size) > settings.MAX_ATTENDANCE_IMAGE_SIZE:
+            return JsonResponse({"error": "Image too large"}, status=413)
 
-        # 3️⃣ Convert to base64 for AI
-        upper_b64 = bytes_to_base64(upper_bytes)
-        full_b64 = bytes_to_base64(full_bytes)
-
-        # 4️⃣ Upload bytes to S3
-        upper_body_url = upload_bytes_to_s3(
-            upper_bytes,
-            "attendance/upper",
-            upper_file.content_type
-        )
-
-        full_body_url = upload_bytes_to_s3(
-            full_bytes,
-            "attendance/full",
-            full_file.content_type
-        )
+        # 2️⃣ Read file bytes ONCE (CRITICAL), hashing while streaming
+        upper_bytes, upper_hash = read_upload(upper_file)
+        full_bytes, full_hash = read_upload(full_file)
+        content_hash = f"{upper_hash}:{full_hash}"
 
-        # 5️⃣ Get or create employee
-        employee, _ = Employee.objects.get_or_create(
-            employee_id=employee_id,
-            defaults={"name": employee_name}
+        analyze_in_background = (
+            verify_type == "self" and settings.ATTIRE_ANALYSIS_IN_BACKGROUND
         )
-
-        # 6️⃣ Prevent multiple punches per day
-        today = now().date()
-        if Attendance.objects.filter(employee=employee, date=today).exists():
+        if analyze_in_background and not has_analysis_capacity():
             return JsonResponse(
-                {"status": "error", "message": "Already punched today"},
-                status=400
+                {"status": "error", "message": "Too many punches being analyzed, try again shortly"},
+                status=503
             )
 
-        status = "SELF_VERIFIED" if verify_type == "self" else "PENDING_ADMIN"
+        # S3 uploads and the AI call are independent network I/O: overlap them
+        executor = ThreadPoolExecutor(max_workers=3)
+        try:
+            # 3️⃣ Upload bytes to S3 (in background)
+            upper_url_future = executor.submit(
+                upload_bytes_to_s3,
+                upper_bytes,
+                "attendance/upper",
+                upper_file.content_type
+            )
 
-        # 7️⃣ Save attendance (URLs ONLY)
-        attendance = Attendance.objects.create(
-            employee=employee,
-            upper_body_image_url=upper_body_url,
-            full_body_image_url=full_body_url,
-            location_text=location_text,
-            status=status
-        )
+            full_url_future = executor.submit(
+                upload_bytes_to_s3,
+                full_bytes,
+                "attendance/full",
+                full_file.content_type
+            )
 
-        # 8️⃣ AI analysis (ONLY for self verify)
-        if verify_type == "self":
-            ai_response = analyze_attire_from_two_images(
-                upper_body_b64=upper_b64,
-                full_body_b64=full_b64,
-                candidate_name=employee_name,
-                candidate_id=employee_id,
+            # 4️⃣ Get or create employee
+            employee, _ = Employee.objects.get_or_create(
+                employee_id=employee_id,
+                defaults={"name": employee_name}
             )
 
-            attendance.ai_response = ai_response
-            attendance.verified_by = "SELF"
-            attendance.verified_at = now()
-            attendance.save()
+            status = "SELF_VERIFIED" if verify_type == "self" else "PENDING_ADMIN"
+
+            # Runs after the response by default; inline when the flag is off
+            analyze_inline = verify_type == "self" and not analyze_in_background
+            ai_future = None
+
+            # 5️⃣ Save attendance first, then attach the S3 URLs.
+            # uniq_att_emp_date rejects a second punch on the same day before
+            # any AI work starts. The insert commits on its own so no
+            # transaction stays open while the uploads run.
+            try:
+                with transaction.atomic():
+                    attendance = Attendance.objects.create(
+                        employee=employee,
+                        upper_body_image_url="",
+                        full_body_image_url="",
+                        location_text=location_text,
+                        status=status
+                    )
+            except IntegrityError:
+                return JsonResponse(
+                    {"status": "error", "message": "Already punched today"},
+                    status=400
+                )
+
+            # 6️⃣ AI analysis (ONLY for self verify), overlapping the uploads
+            if analyze_inline:
+                ai_future = executor.submit(
+                    analyze_attire_from_bytes,
+                    upper_body_bytes=upper_bytes,
+                    full_body_bytes=full_bytes,
+                    candidate_name=employee_name,
+                    candidate_id=employee_id,
+                    content_hash=content_hash,
+                )
+
+            try:
+                attendance.upper_body_image_url = upper_url_future.result()
+                attendance.full_body_image_url = full_url_future.result()
+            except Exception:
+                # Upload failed: drop the URL-less row so the employee can punch
+                # again; a running analysis is left to finish unobserved
+                if ai_future is not None:
+                    ai_future.cancel()
+                attendance.delete()
+                raise
+
+            attendance.save(
+                update_fields=["upper_body_image_url", "full_body_image_url"]
+            )
 
-        # 9️⃣ Final response
-        return JsonResponse({
+            if ai_future is not None:
+                attendance.ai_response = ai_future.result()
+                # Retry hint is for the background worker, not for clients
+                attendance.ai_response.pop("retryable", None)
+                attendance.verified_by = "SELF"
+                attendance.verified_at = now()
+                attendance.save(
+                    update_fields=["ai_response", "verified_by", "verified_at"]
+                )
+
+        finally:
+            # Don't hold the response on an early return
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        response_data = {
             "status": attendance.status,
             "attendance_id": attendance.id,
             "date": str(attendance.date),
@@ -119,13 +181,95 @@ class AnalyzeAttireView(View):
             "upper_body_image_url": attendance.upper_body_image_url,
             "full_body_image_url": attendance.full_body_image_url,
             "ai_analysis": attendance.ai_response
-        })
+        }
+
+        # 7️⃣ Final response (client polls attendance/<id>/?token=... for the analysis)
+        if analyze_in_background:
+            queued = enqueue_attendance_analysis(
+                attendance.id,
+                upper_bytes,
+                full_bytes,
+                employee_name,
+                employee_id,
+                content_hash,
+            )
+            if queued:
+                response_data["status"] = "PROCESSING"
+                response_data["poll_token"] = signing.dumps(
+                    attendance.id, salt=ATTENDANCE_POLL_SALT
+                )
+                return JsonResponse(response_data, status=202)
+
+            # Backlog filled up since the capacity check: analyze inline instead
+            attendance.ai_response = analyze_attire_from_bytes(
+                upper_body_bytes=upper_bytes,
+                full_body_bytes=full_bytes,
+                candidate_name=employee_name,
+                candidate_id=employee_id,
+                content_hash=content_hash,
+            )
+            attendance.ai_response.pop("retryable", None)
+            attendance.verified_by = "SELF"
+            attendance.verified_at = now()
+            attendance.save(
+                update_fields=["ai_response", "verified_by", "verified_at"]
+            )
+            response_data["ai_analysis"] = attendance.ai_response
+
+        return JsonResponse(response_data)
+
 
 
+class AttendanceDetailView(View):
+    """
+    Poll endpoint for a punch's analysis. Only the client that made the punch
+    holds its poll_token, so ids can't be enumerated to read others' feedback.
+    """
+
+    def get(self, request, attendance_id):
+        try:
+            token_id = signing.loads(
+                request.GET.get("token", ""),
+                salt=ATTENDANCE_POLL_SALT,
+                max_age=ATTENDANCE_POLL_MAX_AGE
+            )
+        except signing.BadSignature:
+            return JsonResponse({"error": "Invalid or expired token"}, status=403)
+
+        if token_id != attendance_id:
+            return JsonResponse({"error": "Invalid or expired token"}, status=403)
+
+        try:
+            a = Attendance.objects.select_related("employee").get(id=attendance_id)
+        except Attendance.DoesNotExist:
+            return JsonResponse({"error": "Attendance not found"}, status=404)
+
+        status = a.status
+        if status == "SELF_VERIFIED" and a.ai_response is None:
+            status = "PROCESSING"
+
+        return JsonResponse({
+            "attendance_id": a.id,
+            "employee_id": a.employee.employee_id,
+            "employee_name": a.employee.name,
+            "date": str(a.date),
+            "punch_time": str(a.punch_time),
+            "location": a.location_text,
+            "upper_body_image_url": a.upper_body_image_url,
+            "full_body_image_url": a.full_body_image_url,
+            "verified_by": a.verified_by,
+            "verified_at": str(a.verified_at),
+            "status": status,
+            "ai_analysis": a.ai_response
+        })
+
 
 class DailyAttendanceView(View):
     def get(self, request):
-        date = request.GET.get("date")
+        try:
+            date = datetime.date.fromisoformat(request.GET.get("date", ""))
+        except ValueError:
+            return JsonResponse({"error": "date must be YYYY-MM-DD"}, status=400)
 
         records = Attendance.objects.filter(date=date).values(
             "employee__employee_id",
@@ -153,26 +297,30 @@ class AdminVerifyAttendanceView(APIView):
         if action not in ["approve", "reject"]:
             return Response({"error": "Invalid action"}, status=400)
 
-        try:
-            attendance = Attendance.objects.get(id=attendance_id)
-        except Attendance.DoesNotExist:
-            return Response({"error": "Attendance not found"}, status=404)
-
-        if attendance.status != "PENDING_ADMIN":
-            return Response({"error": "Already verified"}, status=400)
+        new_status = "ADMIN_VERIFIED" if action == "approve" else "REJECTED"
+        verified_by = request.user.username
+        verified_at = now()
 
-        attendance.status = (
-            "ADMIN_VERIFIED" if action == "approve" else "REJECTED"
+        # Single conditional UPDATE: atomic, no read-then-write race
+        updated = Attendance.objects.filter(
+            id=attendance_id,
+            status="PENDING_ADMIN"
+        ).update(
+            status=new_status,
+            verified_by=verified_by,
+            verified_at=verified_at
         )
 
-        attendance.verified_by = request.user.username
-        attendance.verified_at = now()
-        attendance.save()
+        if updated == 0:
+            return Response(
+                {"error": "Already verified or not found"},
+                status=400
+            )
 
         return Response({
-            "status": attendance.status,
-            "verified_by": attendance.verified_by,
-            "verified_at": attendance.verified_at.strftime("%Y-%m-%d %H:%M:%S")
+            "status": new_status,
+            "verified_by": verified_by,
+            "verified_at": verified_at.strftime("%Y-%m-%d %H:%M:%S")
         })
      
         
@@ -183,13 +331,22 @@ class AdminVerifyAttendanceView(APIView):
 class AdminPendingAttendanceView(View):
 
     def get(self, request):
-        records = Attendance.objects.filter(
+        records = Attendance.objects.select_related("employee").filter(
             status="PENDING_ADMIN"
+        ).only(
+            "id",
+            "date",
+            "punch_time",
+            "location_text",
+            "upper_body_image_url",
+            "full_body_image_url",
+            "status",
+            "employee__employee_id",
+            "employee__name",
         ).order_by("-punch_time")
 
-        data = []
-        for a in records:
-            data.append({
+        data = [
+            {
                 "attendance_id": a.id,
                 "employee_id": a.employee.employee_id,
                 "employee_name": a.employee.name,
@@ -199,7 +356,9 @@ class AdminPendingAttendanceView(View):
                 "upper_body_image": a.upper_body_image_url,
                 "full_body_image": a.full_body_image_url,
                 "status": a.status
-            })
+            }
+            for a in records
+        ]
 
         return JsonResponse(data, safe=False)
 
@@ -211,13 +370,24 @@ class AdminPendingAttendanceView(View):
 class AdminVerifiedAttendanceView(View):
 
     def get(self, request):
-        records = Attendance.objects.filter(
+        records = Attendance.objects.select_related("employee").filter(
             status__in=["SELF_VERIFIED", "ADMIN_VERIFIED"]
+        ).only(
+            "id",
+            "date",
+            "punch_time",
+            "location_text",
+            "upper_body_image_url",
+            "full_body_image_url",
+            "status",
+            "verified_by",
+            "verified_at",
+            "employee__employee_id",
+            "employee__name",
         ).order_by("-punch_time")
 
-        data = []
-        for a in records:
-            data.append({
+        data = [
+            {
                 "attendance_id": a.id,
                 "employee_id": a.employee.employee_id,
                 "employee_name": a.employee.name,
@@ -225,11 +395,13 @@ class AdminVerifiedAttendanceView(View):
                 "punch_time": str(a.punch_time),
                 "location": a.location_text,
                 "verified_by": a.verified_by,
-                 "upper_body_image": a.upper_body_image_url,
+                "upper_body_image": a.upper_body_image_url,
                 "full_body_image": a.full_body_image_url,
                 "verified_at": str(a.verified_at),
                 "status": a.status
-            })
+            }
+            for a in records
+        ]
 
         return JsonResponse(data, safe=False)
 